@@ -5,6 +5,7 @@
 #   "mcp",
 #   "pytest",
 #   "pytest-asyncio",
+#   "pytest-xdist",
 # ]
 # ///
 """
@@ -13,12 +14,23 @@ Integration test for RStudio MCP server.
 This script tests the MCP server by connecting via streamable HTTP and
 exercising all the tool endpoints using pytest.
 
+All tests share a single session-scoped ClientSession so the TCP connect
+and MCP initialize handshake happen once per run instead of once per test.
+
+Tests run under pytest-xdist (-n auto, see pytest.ini). --dist=loadfile
+keeps all tests in one file on the same worker, so tests here still run
+sequentially against shared R globals; additional test files get their
+own worker (and their own ClientSession via the session-scoped fixture,
+which is per-worker under xdist). The R server itself must stay a single
+persistent RStudio process - workers share it over HTTP.
+
 Usage:
     Run with: uv run tests/test_integration.py
 """
 
 import json
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 import pytest
@@ -27,8 +39,9 @@ from mcp import ClientSession
 from mcp.client.streamable_http import streamablehttp_client
 
 
+@lru_cache(maxsize=1)
 def get_server_url():
-    """Read the RStudio MCP server URL from .mcp.json"""
+    """Read the RStudio MCP server URL from .mcp.json (cached per process)"""
     config_path = Path(".mcp.json")
     if config_path.exists():
         try:
@@ -41,12 +54,6 @@ def get_server_url():
     return "http://127.0.0.1:16731/"
 
 
-async def get_session():
-    """Helper to create an MCP session"""
-    url = get_server_url()
-    return streamablehttp_client(url)
-
-
 def extract_doc_id_from_insert(result_text):
     """Extract document ID from create_document result"""
     return result_text.split("ID:")[1].strip()
@@ -65,456 +72,414 @@ async def cleanup_document(session, doc_id):
     })
 
 
-@pytest_asyncio.fixture(autouse=True)
-async def clean_environment():
-    """Clean the R environment and close all documents before each test"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-            # Remove all objects from global environment (except MCP server reference)
-            await session.call_tool("eval_r", {
-                "code": """
-                # Remove everything except .rstudiomcp_server
-                objs_to_remove <- setdiff(ls(all.names = TRUE), ".rstudiomcp_server")
-                rm(list = objs_to_remove)
-                """,
-                "allow_reassign": True
-            })
-            # Close all open documents by repeatedly closing the active document
-            await session.call_tool("eval_r", {
-                "code": """
-                tryCatch({
-                  # Close up to 20 documents (safety limit)
-                  for (i in 1:20) {
-                    ctx <- rstudioapi::getActiveDocumentContext()
-                    if (is.null(ctx$id) || ctx$id == "#console" || !nzchar(ctx$id)) {
-                      break
-                    }
-                    rstudioapi::documentClose(id = ctx$id, save = FALSE)
-                  }
-                }, error = function(e) invisible())
-                """,
-                "allow_reassign": True
-            })
-    yield
-    # Teardown: could clean up here if needed
-
-
-@pytest.mark.asyncio
-async def test_list_tools():
-    """Test listing available tools"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-            tools = await session.list_tools()
-            assert len(tools.tools) == 13
-
-            tool_names = [tool.name for tool in tools.tools]
-            expected_tools = [
-                "eval_r", "list_environments", "list_objects", "get_object",
-                "get_console_history", "get_active_document",
-                "create_document", "open_document_file",
-                "insert_text", "replace_text_range", "source_active_document",
-                "get_current_plot", "get_latest_viewer_content"
-            ]
-            for expected in expected_tools:
-                assert expected in tool_names
-
-
-@pytest.mark.asyncio
-async def test_eval_r_basic():
-    """Test basic R code execution"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            result = await session.call_tool("eval_r", {
-                "code": "integration_test_var <- 42 + 8"
-            })
-            assert result.content[0].type == "text"
-
-            # Verify variable was created
-            result = await session.call_tool("list_objects", {})
-            assert "integration_test_var" in result.content[0].text
-
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def mcp_session():
+    """Single initialized MCP session shared by all tests in the run
 
-@pytest.mark.asyncio
-async def test_eval_r_allow_reassign_protection():
-    """Test that eval_r prevents reassignment by default"""
-    async with await get_session() as (read_stream, write_stream, _):
+    The streamable HTTP transport is opened here too, so every request in
+    the run reuses one kept-alive TCP connection instead of paying a fresh
+    connect per test.
+    """
+    async with streamablehttp_client(get_server_url()) as (
+        read_stream, write_stream, _
+    ):
         async with ClientSession(read_stream, write_stream) as session:
             await session.initialize()
+            yield session
 
-            # Create a variable
-            await session.call_tool("eval_r", {"code": "test_reassign_var <- 10"})
 
-            # Try to reassign without permission
-            with pytest.raises(Exception) as exc_info:
-                await session.call_tool("eval_r", {
-                    "code": "test_reassign_var <- 20",
-                    "allow_reassign": False
-                })
-            assert "overwrite existing variable" in str(exc_info.value)
-
-
-@pytest.mark.asyncio
-async def test_eval_r_allow_reassign_true():
-    """Test that eval_r allows reassignment with allow_reassign=true"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
+@pytest_asyncio.fixture(autouse=True, loop_scope="session")
+async def clean_environment(mcp_session):
+    """Clean the R environment and close all documents before each test"""
+    # Remove all objects from global environment (except MCP server reference)
+    # and close all open documents by repeatedly closing the active document.
+    # Both steps go in one eval_r call so the fixture costs a single
+    # round-trip per test.
+    await mcp_session.call_tool("eval_r", {
+        "code": """
+        # Remove everything except .rstudiomcp_server
+        objs_to_remove <- setdiff(ls(all.names = TRUE), ".rstudiomcp_server")
+        rm(list = objs_to_remove)
+        tryCatch({
+          # Close up to 20 documents (safety limit)
+          for (i in 1:20) {
+            ctx <- rstudioapi::getActiveDocumentContext()
+            if (is.null(ctx$id) || ctx$id == "#console" || !nzchar(ctx$id)) {
+              break
+            }
+            rstudioapi::documentClose(id = ctx$id, save = FALSE)
+          }
+        }, error = function(e) invisible())
+        """,
+        "allow_reassign": True
+    })
+    yield
+    # Teardown: could clean up here if needed
 
-            # Create a variable
-            await session.call_tool("eval_r", {"code": "test_reassign_ok <- 10"})
 
-            # Reassign with permission
-            result = await session.call_tool("eval_r", {
-                "code": "test_reassign_ok <- 20",
-                "allow_reassign": True
+@pytest.mark.asyncio(loop_scope="session")
+async def test_list_tools(mcp_session):
+    """Test listing available tools"""
+    tools = await mcp_session.list_tools()
+    assert len(tools.tools) == 13
+
+    expected_tools = [
+        "eval_r", "list_environments", "list_objects", "get_object",
+        "get_console_history", "get_active_document",
+        "create_document", "open_document_file",
+        "insert_text", "replace_text_range", "source_active_document",
+        "get_current_plot", "get_latest_viewer_content"
+    ]
+    missing = set(expected_tools) - {tool.name for tool in tools.tools}
+    assert not missing, f"Missing tools: {missing}"
+
+
+@pytest.mark.parametrize(
+    "setup_code,code,allow_reassign,expect_error,expect_in_output",
+    [
+        # Basic execution: create a variable and list it in one round-trip
+        (None, "integration_test_var <- 42 + 8; ls()", False,
+         None, "integration_test_var"),
+        # Reassignment without permission is rejected
+        ("test_reassign_var <- 10", "test_reassign_var <- 20", False,
+         "overwrite existing variable", None),
+        # Reassignment with allow_reassign=true succeeds
+        ("test_reassign_ok <- 10", "test_reassign_ok <- 20", True,
+         None, None),
+    ],
+    ids=["basic", "reassign-protected", "reassign-allowed"],
+)
+@pytest.mark.asyncio(loop_scope="session")
+async def test_eval_r(mcp_session, setup_code, code, allow_reassign,
+                      expect_error, expect_in_output):
+    """Test eval_r execution and its allow_reassign protection"""
+    if setup_code:
+        await mcp_session.call_tool("eval_r", {"code": setup_code})
+
+    if expect_error:
+        with pytest.raises(Exception) as exc_info:
+            await mcp_session.call_tool("eval_r", {
+                "code": code,
+                "allow_reassign": allow_reassign
             })
-            assert result.content[0].type == "text"
-
-
-@pytest.mark.asyncio
-async def test_list_environments():
+        assert expect_error in str(exc_info.value)
+    else:
+        result = await mcp_session.call_tool("eval_r", {
+            "code": code,
+            "allow_reassign": allow_reassign
+        })
+        assert result.content[0].type == "text"
+        if expect_in_output:
+            assert expect_in_output in result.content[0].text
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_list_environments(mcp_session):
     """Test listing R environments"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            result = await session.call_tool("list_environments", {})
-            envs = result.content[0].text.split('\n')
+    result = await mcp_session.call_tool("list_environments", {})
+    envs = set(result.content[0].text.split('\n'))
 
-            assert ".GlobalEnv" in envs
-            assert "package:base" in envs
+    assert {".GlobalEnv", "package:base"} <= envs
 
 
-@pytest.mark.asyncio
-async def test_list_objects():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_list_objects(mcp_session):
     """Test listing objects in environment"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            # Create some test objects
-            await session.call_tool("eval_r", {
-                "code": "obj1 <- 1; obj2 <- 2; obj3 <- 3"
-            })
+    # Create some test objects
+    await mcp_session.call_tool("eval_r", {
+        "code": "obj1 <- 1; obj2 <- 2; obj3 <- 3"
+    })
 
-            result = await session.call_tool("list_objects", {})
-            objects = result.content[0].text
+    # Set membership on the split lines avoids substring collisions
+    # (e.g. "obj1" matching "obj10")
+    result = await mcp_session.call_tool("list_objects", {})
+    objects = set(result.content[0].text.split('\n'))
 
-            assert "obj1" in objects
-            assert "obj2" in objects
-            assert "obj3" in objects
+    assert {"obj1", "obj2", "obj3"} <= objects
 
 
-@pytest.mark.asyncio
-async def test_get_object():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_object(mcp_session):
     """Test getting object details"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            # Create a test data frame
-            await session.call_tool("eval_r", {
-                "code": "test_df <- data.frame(a = 1:3, b = c('x', 'y', 'z'))"
-            })
+    # Create a test data frame
+    await mcp_session.call_tool("eval_r", {
+        "code": "test_df <- data.frame(a = 1:3, b = c('x', 'y', 'z'))"
+    })
 
-            result = await session.call_tool("get_object", {"name": "test_df"})
-            obj_text = result.content[0].text
+    result = await mcp_session.call_tool("get_object", {"name": "test_df"})
+    obj_text = result.content[0].text
 
-            assert "data.frame" in obj_text
-            assert "3 obs" in obj_text
+    assert "data.frame" in obj_text
+    assert "3 obs" in obj_text
 
 
-@pytest.mark.asyncio
-async def test_get_console_history():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_console_history(mcp_session):
     """Test getting console history"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            result = await session.call_tool("get_console_history", {"max_lines": 5})
-            assert result.content[0].type == "text"
-            # History might be empty, just check it doesn't error
+    result = await mcp_session.call_tool("get_console_history", {"max_lines": 5})
+    assert result.content[0].type == "text"
+    # History might be empty, just check it doesn't error
 
 
-@pytest.mark.asyncio
-async def test_create_document():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_document(mcp_session):
     """Test creating a new document (untitled)"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            result = await session.call_tool("create_document", {
-                "text": "# Test document\nprint('Hello')\n"
-            })
+    result = await mcp_session.call_tool("create_document", {
+        "text": "# Test document\nprint('Hello')\n"
+    })
 
-            response_text = result.content[0].text
-            assert "Created new document with ID:" in response_text
+    response_text = result.content[0].text
+    assert "Created new document with ID:" in response_text
 
-            # Extract document ID
-            doc_id = extract_doc_id_from_insert(response_text)
+    # Extract document ID
+    doc_id = extract_doc_id_from_insert(response_text)
 
-            # Verify it's active and we can read it
-            result = await session.call_tool("get_active_document", {})
-            contents = result.content[0].text
-            assert "ID:" in contents
-            assert "Path: <untitled>" in contents
-            assert "# Test document" in contents
-            assert "print('Hello')" in contents
+    # Verify it's active and we can read it
+    result = await mcp_session.call_tool("get_active_document", {})
+    contents = result.content[0].text
+    assert "ID:" in contents
+    assert "Path: <untitled>" in contents
+    assert "# Test document" in contents
+    assert "print('Hello')" in contents
 
-            # Clean up
-            await cleanup_document(session, doc_id)
+    # Clean up
+    await cleanup_document(mcp_session, doc_id)
 
 
-@pytest.mark.asyncio
-async def test_create_document_with_path():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_document_with_path(mcp_session):
     """Test creating a new document with a file path"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            # Create a temporary file path
-            temp_file = "test_create_with_path.R"
-            result = await session.call_tool("eval_r", {
-                "code": f'file.path(tempdir(), "{temp_file}")',
-                "allow_reassign": True
-            })
-            temp_path = result.content[0].text.strip().replace('[1] "', '').replace('"', '')
-
-            # Create a document with path
-            result = await session.call_tool("create_document", {
-                "text": "# Saved test\nx <- 42\nprint(x)",
-                "path": temp_path
-            })
+    # Create a temporary file path
+    temp_file = "test_create_with_path.R"
+    # cat() so the response is the bare path, no [1] prefix or quotes
+    result = await mcp_session.call_tool("eval_r", {
+        "code": f'cat(file.path(tempdir(), "{temp_file}"))',
+        "allow_reassign": True
+    })
+    temp_path = result.content[0].text.strip()
 
-            response_text = result.content[0].text
-            assert "Created new document at:" in response_text
-            assert temp_file in response_text
+    # Create a document with path
+    result = await mcp_session.call_tool("create_document", {
+        "text": "# Saved test\nx <- 42\nprint(x)",
+        "path": temp_path
+    })
 
-            # Extract document ID
-            doc_id = extract_doc_id_from_insert(response_text)
+    response_text = result.content[0].text
+    assert "Created new document at:" in response_text
+    assert temp_file in response_text
 
-            # Verify it's active and has a proper path
-            result = await session.call_tool("get_active_document", {})
-            contents = result.content[0].text
-            assert "ID:" in contents
-            assert temp_file in contents  # Path should contain filename
-            assert "# Saved test" in contents
-            assert "x <- 42" in contents
+    # Extract document ID
+    doc_id = extract_doc_id_from_insert(response_text)
 
-            # Verify file exists on disk
-            result = await session.call_tool("eval_r", {
-                "code": f'file.exists("{temp_path}")'
-            })
-            assert "TRUE" in result.content[0].text
+    # Verify it's active and has a proper path
+    result = await mcp_session.call_tool("get_active_document", {})
+    contents = result.content[0].text
+    assert "ID:" in contents
+    assert temp_file in contents  # Path should contain filename
+    assert "# Saved test" in contents
+    assert "x <- 42" in contents
 
-            # Clean up
-            await cleanup_document(session, doc_id)
-            await session.call_tool("eval_r", {
-                "code": f'unlink("{temp_path}")',
-                "allow_reassign": True
-            })
+    # Verify file exists on disk
+    result = await mcp_session.call_tool("eval_r", {
+        "code": f'file.exists("{temp_path}")'
+    })
+    assert "TRUE" in result.content[0].text
+
+    # Clean up: close the document and delete the file in one call
+    await mcp_session.call_tool("eval_r", {
+        "code": (
+            f'rstudioapi::documentClose(id = "{doc_id}", save = FALSE)\n'
+            f'unlink("{temp_path}")'
+        ),
+        "allow_reassign": True
+    })
 
 
-@pytest.mark.asyncio
-async def test_insert_text_active_document():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_insert_text_active_document(mcp_session):
     """Test inserting text into the active document"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            # Create a document
-            result = await session.call_tool("create_document", {
-                "text": "# Original content"
-            })
-            doc_id = extract_doc_id_from_insert(result.content[0].text)
+    # Create a document
+    result = await mcp_session.call_tool("create_document", {
+        "text": "# Original content"
+    })
+    doc_id = extract_doc_id_from_insert(result.content[0].text)
 
-            # Insert more text
-            await session.call_tool("insert_text", {
-                "text": "\nx <- 42"
-            })
+    # Insert more text
+    await mcp_session.call_tool("insert_text", {
+        "text": "\nx <- 42"
+    })
 
-            # Verify content was inserted
-            result = await session.call_tool("get_active_document", {})
-            contents = result.content[0].text
-            assert "ID:" in contents
-            assert "# Original content" in contents
-            assert "x <- 42" in contents
+    # Verify content was inserted
+    result = await mcp_session.call_tool("get_active_document", {})
+    contents = result.content[0].text
+    assert "ID:" in contents
+    assert "# Original content" in contents
+    assert "x <- 42" in contents
 
-            # Clean up
-            await cleanup_document(session, doc_id)
+    # Clean up
+    await cleanup_document(mcp_session, doc_id)
 
 
-@pytest.mark.asyncio
-async def test_open_document_file():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_open_document_file(mcp_session):
     """Test opening a saved document file"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            # Create a temporary R file
-            temp_file = "test_open_script.R"
-            result = await session.call_tool("eval_r", {
-                "code": f'''
-                temp_path <- file.path(tempdir(), "{temp_file}")
-                writeLines(c("# Saved test", "y <- 100", "print(y)"), temp_path)
-                temp_path
-                ''',
-                "allow_reassign": True
-            })
-            temp_path = result.content[0].text.strip().replace('[1] "', '').replace('"', '')
+    # Create a temporary R file
+    temp_file = "test_open_script.R"
+    result = await mcp_session.call_tool("eval_r", {
+        "code": f'''
+        temp_path <- file.path(tempdir(), "{temp_file}")
+        writeLines(c("# Saved test", "y <- 100", "print(y)"), temp_path)
+        cat(temp_path)
+        ''',
+        "allow_reassign": True
+    })
+    temp_path = result.content[0].text.strip()
 
-            # Open the file
-            result = await session.call_tool("open_document_file", {
-                "file_path": temp_path
-            })
+    # Open the file
+    result = await mcp_session.call_tool("open_document_file", {
+        "file_path": temp_path
+    })
 
-            assert "Opened document:" in result.content[0].text
-            assert temp_file in result.content[0].text
-
-            # Verify it's active and we can read it
-            result = await session.call_tool("get_active_document", {})
-            contents = result.content[0].text
-            assert "ID:" in contents
-            assert "Path:" in contents
-            assert temp_file in contents  # Filename should be in path
-            assert "# Saved test" in contents
-            assert "y <- 100" in contents
-
-            # Clean up
-            await session.call_tool("eval_r", {
-                "code": f'unlink("{temp_path}")',
-                "allow_reassign": True
-            })
+    assert "Opened document:" in result.content[0].text
+    assert temp_file in result.content[0].text
+
+    # Verify it's active and we can read it
+    result = await mcp_session.call_tool("get_active_document", {})
+    contents = result.content[0].text
+    assert "ID:" in contents
+    assert "Path:" in contents
+    assert temp_file in contents  # Filename should be in path
+    assert "# Saved test" in contents
+    assert "y <- 100" in contents
+
+    # Clean up: close the opened document and delete the file in one call
+    await mcp_session.call_tool("eval_r", {
+        "code": (
+            'ctx <- rstudioapi::getActiveDocumentContext()\n'
+            'rstudioapi::documentClose(id = ctx$id, save = FALSE)\n'
+            f'unlink("{temp_path}")'
+        ),
+        "allow_reassign": True
+    })
 
 
-@pytest.mark.asyncio
-async def test_replace_text_range_active():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_replace_text_range_active(mcp_session):
     """Test replacing text in the active document"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            # Create a document
-            result = await session.call_tool("create_document", {
-                "text": "old_value <- 123"
-            })
-            doc_id = extract_doc_id_from_insert(result.content[0].text)
+    # Create a document
+    result = await mcp_session.call_tool("create_document", {
+        "text": "old_value <- 123"
+    })
+    doc_id = extract_doc_id_from_insert(result.content[0].text)
 
-            # Replace text
-            result = await session.call_tool("replace_text_range", {
-                "old_string": "old_value <- 123",
-                "new_string": "new_value <- 456"
-            })
+    # Replace text
+    result = await mcp_session.call_tool("replace_text_range", {
+        "old_string": "old_value <- 123",
+        "new_string": "new_value <- 456"
+    })
 
-            assert "Text replaced successfully" in result.content[0].text
+    assert "Text replaced successfully" in result.content[0].text
 
-            # Verify replacement
-            result = await session.call_tool("get_active_document", {})
-            assert "new_value <- 456" in result.content[0].text
+    # Verify replacement
+    result = await mcp_session.call_tool("get_active_document", {})
+    assert "new_value <- 456" in result.content[0].text
 
-            # Clean up
-            await cleanup_document(session, doc_id)
+    # Clean up
+    await cleanup_document(mcp_session, doc_id)
 
 
-@pytest.mark.asyncio
-async def test_source_active_document():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_source_active_document(mcp_session):
     """Test sourcing the active document"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            # Create a document with R code
-            result = await session.call_tool("create_document", {
-                "text": "source_test_var <- 999"
-            })
-            doc_id = extract_doc_id_from_insert(result.content[0].text)
-
-            # Source the active document
-            result = await session.call_tool("source_active_document", {})
+    # Create a document with R code
+    result = await mcp_session.call_tool("create_document", {
+        "text": "source_test_var <- 999"
+    })
+    doc_id = extract_doc_id_from_insert(result.content[0].text)
 
-            assert "Sourced document:" in result.content[0].text
-            assert "source_test_var <- 999" in result.content[0].text
+    # Source the active document
+    result = await mcp_session.call_tool("source_active_document", {})
 
-            # Verify variable was created
-            result = await session.call_tool("list_objects", {})
-            assert "source_test_var" in result.content[0].text
+    assert "Sourced document:" in result.content[0].text
+    assert "source_test_var <- 999" in result.content[0].text
 
-            # Clean up
-            await cleanup_document(session, doc_id)
+    # Verify the variable was created and clean up in one round-trip
+    result = await mcp_session.call_tool("eval_r", {
+        "code": (
+            f'rstudioapi::documentClose(id = "{doc_id}", save = FALSE)\n'
+            'exists("source_test_var")'
+        ),
+        "allow_reassign": True
+    })
+    assert "TRUE" in result.content[0].text
 
 
-@pytest.mark.asyncio
-async def test_source_active_document_partial():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_source_active_document_partial(mcp_session):
     """Test sourcing only specific lines of the active document"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
+    # Create a document with multiple lines
+    result = await mcp_session.call_tool("create_document", {
+        "text": "var_a <- 1\nvar_b <- 2\nvar_c <- 3\nvar_d <- 4"
+    })
+    doc_id = extract_doc_id_from_insert(result.content[0].text)
 
-            # Create a document with multiple lines
-            result = await session.call_tool("create_document", {
-                "text": "var_a <- 1\nvar_b <- 2\nvar_c <- 3\nvar_d <- 4"
-            })
-            doc_id = extract_doc_id_from_insert(result.content[0].text)
+    # Source only lines 2-3
+    result = await mcp_session.call_tool("source_active_document", {
+        "start_line": 2,
+        "end_line": 3
+    })
 
-            # Source only lines 2-3
-            result = await session.call_tool("source_active_document", {
-                "start_line": 2,
-                "end_line": 3
-            })
+    assert "(lines 2-3)" in result.content[0].text
+    assert "var_b <- 2" in result.content[0].text
+    assert "var_c <- 3" in result.content[0].text
 
-            assert "(lines 2-3)" in result.content[0].text
-            assert "var_b <- 2" in result.content[0].text
-            assert "var_c <- 3" in result.content[0].text
-
-            # Verify only var_b and var_c were created
-            result = await session.call_tool("list_objects", {})
-            objects = result.content[0].text
-            assert "var_b" in objects
-            assert "var_c" in objects
-            # var_a and var_d should not exist
-            assert "var_a" not in objects
-            assert "var_d" not in objects
-
-            # Verify that lines 2-3 are now selected in the editor
-            result = await session.call_tool("eval_r", {
-                "code": """
-                ctx <- rstudioapi::getSourceEditorContext()
-                sel <- ctx$selection[[1]]$range
-                list(start = sel$start[['row']], end = sel$end[['row']])
-                """
-            })
-            selection_info = result.content[0].text
-            # Should show that rows 2-3 are selected
-            assert "start" in selection_info
-            assert "2" in selection_info  # Start line should be 2
-            assert "3" in selection_info  # End line should be 3
+    # Verify only var_b and var_c were created. Filtering server-side
+    # keeps the response bounded no matter what else the session holds.
+    result = await mcp_session.call_tool("list_objects", {
+        "pattern": "^var_[a-d]$"
+    })
+    objects = result.content[0].text
+    assert "var_b" in objects
+    assert "var_c" in objects
+    # var_a and var_d should not exist
+    assert "var_a" not in objects
+    assert "var_d" not in objects
+
+    # Verify that lines 2-3 are now selected in the editor
+    result = await mcp_session.call_tool("eval_r", {
+        "code": """
+        ctx <- rstudioapi::getSourceEditorContext()
+        sel <- ctx$selection[[1]]$range
+        list(start = sel$start[['row']], end = sel$end[['row']])
+        """
+    })
+    selection_info = result.content[0].text
+    # Should show that rows 2-3 are selected
+    assert "start" in selection_info
+    assert "2" in selection_info  # Start line should be 2
+    assert "3" in selection_info  # End line should be 3
 
-            # Clean up
-            await cleanup_document(session, doc_id)
+    # Clean up
+    await cleanup_document(mcp_session, doc_id)
 
 
-@pytest.mark.asyncio
-async def test_get_current_plot():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_current_plot(mcp_session):
     """Test capturing a plot"""
-    async with await get_session() as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-
-            # Create a simple plot
-            await session.call_tool("eval_r", {"code": "plot(1:10, 1:10)"})
-
-            result = await session.call_tool("get_current_plot", {
-                "width": 400,
-                "height": 300,
-                "format": "png"
-            })
+    # Create a simple plot
+    await mcp_session.call_tool("eval_r", {"code": "plot(1:10, 1:10)"})
+
+    # 100x100 keeps the base64 payload small while staying large enough
+    # for base graphics to replay (tiny devices fail in plot.new() with
+    # "figure margins too large")
+    result = await mcp_session.call_tool("get_current_plot", {
+        "width": 100,
+        "height": 100,
+        "format": "png"
+    })
 
-            assert result.content[0].type == "image"
-            assert len(result.content[0].data) > 100  # Should have substantial base64 data
+    assert result.content[0].type == "image"
+    assert len(result.content[0].data) > 100  # Should have substantial base64 data
 
 
 if __name__ == "__main__":